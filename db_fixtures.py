@@ -3,7 +3,7 @@ import inspect
 import json
 import sys
 from datetime import date, datetime
-from typing import List
+from typing import List, Optional
 from unittest.mock import AsyncMock, MagicMock
 from uuid import uuid4
 
@@ -12,7 +12,7 @@ import pytest
 from dateutil.relativedelta import relativedelta
 from mock_alchemy.mocking import UnifiedAlchemyMagicMock
 from pytest_mock import MockerFixture
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, insert
 from sqlalchemy.orm import sessionmaker
 
 from api.serializers.enums import (
@@ -65,11 +65,16 @@ from worker.task_scheduler import TaskScheduler
 
 # pylint: disable=redefined-outer-name
 
+# Captured once so Sequence lambdas derive ids by offset instead of taking a
+# clock reading per built instance; uniqueness comes from the sequence
+# counter.
+_BASE_ID = get_timestamp_as_id()
+
 
 @pytest.fixture(scope="session")
 def db_engine():
     options = DB_OPTIONS.copy()
-    return create_engine(options.pop("uri"), **options)
+    return create_engine(options.pop("uri"), **options, insertmanyvalues_page_size=1000)
 
 
 @pytest.fixture(scope="session")
@@ -79,30 +84,81 @@ def db_connection(db_engine):
     connection.close()
 
 
+@pytest.fixture(scope="session")
+def db_sessionmaker(db_connection):
+    return sessionmaker(bind=db_connection)
+
+
 @pytest.fixture(scope="function")
-def db_session(db_connection):
+def db_session(db_connection, db_sessionmaker):
     transaction = db_connection.begin()
-    session_factory = sessionmaker(bind=db_connection)
-    session = session_factory()
+    session = db_sessionmaker()
+    # Factory classes outlive the test (session scope), so point every
+    # registered class at this test's session. Session-scoped factory
+    # fixtures are set up before this function-scoped one, so the registry
+    # is complete by the time we bind.
+    for factory_cls in _SESSION_FACTORIES:
+        factory_cls._meta.sqlalchemy_session = session
     yield session
+    # Unbind so a test that uses a factory without requesting db_session
+    # fails loudly instead of silently writing through the previous test's
+    # closed session (whose autobegun transaction would never roll back).
+    for factory_cls in _SESSION_FACTORIES:
+        factory_cls._meta.sqlalchemy_session = None
     session.close()
     transaction.rollback()
 
 
-@pytest.fixture(scope="function")
-def mock_db_session_managed(mocker: MockerFixture, db_session):
-    func_name_to_patch = "get_session_managed"
-    for module_name, module in list(sys.modules.items()):
-        if not inspect.ismodule(module):
-            continue
-        for obj_name, obj in module.__dict__.items():
-            # noinspection PyBroadException
-            try:  # need that as inspect may raise for some modules
-                if inspect.isfunction(obj) and obj_name == func_name_to_patch:
-                    session_managed = mocker.patch(f"{module_name}.{func_name_to_patch}")
-                    session_managed.return_value.__enter__.return_value = db_session
-            except Exception:  # pylint: disable=broad-except
+# First-party packages whose modules may hold a get_session_managed reference.
+_FIRST_PARTY_PACKAGES = ("api", "db", "server", "worker")
+_FIRST_PARTY_PREFIXES = tuple(f"{package}." for package in _FIRST_PARTY_PACKAGES)
+
+# None means "not scanned yet"; the module count records the sys.modules size
+# at scan time so later imports trigger a rescan.
+_GET_SESSION_MANAGED_USERS: Optional[List[str]] = None
+_GET_SESSION_MANAGED_MODULE_COUNT = 0
+
+
+def _get_session_managed_users() -> List[str]:
+    """Module names that reference get_session_managed, cached between scans.
+
+    Walking every attribute of every loaded module per test is O(modules x
+    attributes); a single lookup of the one relevant name per first-party
+    module is enough. The result is reused until sys.modules changes size,
+    so modules imported mid-suite are still picked up.
+    """
+    global _GET_SESSION_MANAGED_USERS, _GET_SESSION_MANAGED_MODULE_COUNT
+    if (
+        _GET_SESSION_MANAGED_USERS is None
+        or len(sys.modules) != _GET_SESSION_MANAGED_MODULE_COUNT
+    ):
+        _GET_SESSION_MANAGED_MODULE_COUNT = len(sys.modules)
+        users = []
+        for module_name, module in list(sys.modules.items()):
+            if module_name not in _FIRST_PARTY_PACKAGES and not module_name.startswith(
+                _FIRST_PARTY_PREFIXES
+            ):
                 continue
+            if module is None:
+                continue
+            if inspect.isfunction(vars(module).get("get_session_managed")):
+                users.append(module_name)
+        _GET_SESSION_MANAGED_USERS = users
+    return _GET_SESSION_MANAGED_USERS
+
+
+@pytest.fixture
+def _get_session_managed_targets() -> List[str]:
+    # Function-scoped so modules imported after the first DB test still get
+    # patched; the heavy discovery is cached in _get_session_managed_users.
+    return [f"{module_name}.get_session_managed" for module_name in _get_session_managed_users()]
+
+
+@pytest.fixture(scope="function")
+def mock_db_session_managed(mocker: MockerFixture, db_session, _get_session_managed_targets):
+    for target in _get_session_managed_targets:
+        session_managed = mocker.patch(target)
+        session_managed.return_value.__enter__.return_value = db_session
     yield db_session
 
 
@@ -115,32 +171,107 @@ def mock_db_session(mocker):
 
 
 @pytest.fixture
-def base_factory(db_session):
-    class BaseFactory(factory_boy.alchemy.SQLAlchemyModelFactory):
+def mock_db_session_sqlite(mocker):
+    """In-memory SQLite alternative to mock_db_session.
+
+    UnifiedAlchemyMagicMock tracks every query in Python and never executes
+    real SQL; a throwaway SQLite engine is faster for query-heavy tests and
+    exercises actual SQL paths. Opt-in — tests relying on mock-alchemy's
+    call-recording semantics stay on mock_db_session.
+    """
+    engine = create_engine("sqlite:///:memory:")
+    Project.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    mocker.patch("db.utils.get_session", return_value=session)
+    yield session
+    session.close()
+    engine.dispose()
+
+
+# Factory classes are built once per session (see the session-scoped factory
+# fixtures below); each class registers itself here so the db_session fixture
+# can rebind it to the per-test session.
+_SESSION_FACTORIES: List[type] = []
+
+
+def _register_factory(factory_cls):
+    _SESSION_FACTORIES.append(factory_cls)
+    return factory_cls
+
+
+class BulkCreateFactoryMixin:
+    @classmethod
+    def create_batch_bulk(cls, size, **kwargs):
+        """Persist ``size`` instances with a single executemany INSERT.
+
+        Bypasses the unit of work entirely: instances are built, dumped to
+        plain column dicts and inserted via one ``insert(model)`` execution,
+        which insertmanyvalues pages at the engine's configured batch size.
+
+        Flat models only: relationship attributes (SubFactory parents such
+        as RegionFactory's keystone/ddos_endpoint) are not persisted by the
+        raw INSERT. Factories that declare relationships should stick to
+        ``create_batch``.
+        """
+        instances = cls.build_batch(size, **kwargs)
+        columns = cls._meta.model.__table__.columns.keys()
+        rows = [
+            {key: value for key, value in vars(instance).items() if key in columns}
+            for instance in instances
+        ]
+        session = cls._meta.sqlalchemy_session
+        session.execute(insert(cls._meta.model), rows)
+        return instances
+
+
+@pytest.fixture(scope="session")
+def base_factory():
+    class BaseFactory(BulkCreateFactoryMixin, factory_boy.alchemy.SQLAlchemyModelFactory):
         class Meta:
             abstract = True
-            sqlalchemy_session = db_session
+            sqlalchemy_session = None
             sqlalchemy_session_persistence = factory_boy.alchemy.SESSION_PERSISTENCE_FLUSH
 
+        @classmethod
+        def create_bulk(cls, size, **kwargs):
+            """Create ``size`` instances with batched INSERTs.
+
+            Unlike ``create_batch``, which flushes one INSERT per instance,
+            this builds the instances in memory and persists them in one
+            ``bulk_save_objects`` call, letting insertmanyvalues batch the
+            statements.
+
+            Flat models only: build_batch propagates the BUILD strategy to
+            SubFactory parents, so they are never persisted and FK columns
+            resolved from them stay unset; bulk_save_objects does not
+            cascade relationships either. Factories that declare
+            relationships should stick to ``create_batch``.
+            """
+            instances = cls.build_batch(size, **kwargs)
+            session = cls._meta.sqlalchemy_session
+            session.bulk_save_objects(instances)
+            session.flush()
+            return instances
+
     return BaseFactory
 
 
-@pytest.fixture(name="project_factory")
+@pytest.fixture(name="project_factory", scope="session")
 def _project_factory(base_factory, client_factory):
     class ProjectFactory(base_factory):
-        id = factory_boy.Sequence(lambda n: get_timestamp_as_id() - n)
+        id = factory_boy.Sequence(lambda n: _BASE_ID - n)
         client_id = factory_boy.LazyAttribute(lambda _: client_factory().id)
 
         class Meta:
             model = Project
 
-    return ProjectFactory
+    return _register_factory(ProjectFactory)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def keystone_factory(base_factory):
     class KeystoneFactory(base_factory):
-        id = factory_boy.Sequence(lambda n: get_timestamp_as_id() - n)
+        id = factory_boy.Sequence(lambda n: _BASE_ID - n)
         url = "foobar"
         state = "NEW"
         keystone_federated_domain_id = "foobar"
@@ -148,13 +279,13 @@ def keystone_factory(base_factory):
         class Meta:
             model = Keystone
 
-    return KeystoneFactory
+    return _register_factory(KeystoneFactory)
 
 
-@pytest.fixture(name="service_endpoint_factory")
+@pytest.fixture(name="service_endpoint_factory", scope="session")
 def _service_endpoint_factory(base_factory):
     class ServiceEndpointFactory(base_factory):
-        url = factory_boy.Sequence(lambda n: f"https://api.preprod.world/security/iaas{get_timestamp_as_id() - n}")
+        url = factory_boy.Sequence(lambda n: f"https://api.preprod.world/security/iaas{_BASE_ID - n}")
         service = "ddos"
         admin_username = ""
         admin_password = ""
@@ -162,55 +293,51 @@ def _service_endpoint_factory(base_factory):
         class Meta:
             model = ServiceEndpoint
 
-    return ServiceEndpointFactory
+    return _register_factory(ServiceEndpointFactory)
 
 
-@pytest.fixture(name="region_factory")
+@pytest.fixture(name="region_factory", scope="session")
 def _region_factory(base_factory, keystone_factory, service_endpoint_factory):
     class RegionFactory(base_factory):
-        id = factory_boy.Sequence(lambda n: get_timestamp_as_id() - n)
-        display_name = factory_boy.Sequence(lambda n: str(get_timestamp_as_id() - n))
-        keystone = keystone_factory.create()
-        keystone_name = keystone.id
+        id = factory_boy.Sequence(lambda n: _BASE_ID - n)
+        display_name = factory_boy.Sequence(lambda n: str(_BASE_ID - n))
+        keystone = factory_boy.SubFactory(keystone_factory)
+        keystone_name = factory_boy.LazyAttribute(lambda o: o.keystone.id)
         state = RegionState.ACTIVE
         access_level = RegionAccessType.CORE
-        ddos_endpoint = service_endpoint_factory.create()
+        ddos_endpoint = factory_boy.SubFactory(service_endpoint_factory)
 
         class Meta:
             model = Region
 
-    return RegionFactory
+    return _register_factory(RegionFactory)
 
 
-@pytest.fixture(name="client_factory")
+@pytest.fixture(name="client_factory", scope="session")
 def _client_factory(base_factory):
     class ClientFactory(base_factory):
-        id = factory_boy.Sequence(lambda n: get_timestamp_as_id() - n)
+        id = factory_boy.Sequence(lambda n: _BASE_ID - n)
         reseller_id = id
         product_status = ProductStatus.ACTIVE
 
         class Meta:
             model = Client
 
-    return ClientFactory
+    return _register_factory(ClientFactory)
 
 
-@pytest.fixture(name="aicluster_factory")
+@pytest.fixture(name="aicluster_factory", scope="session")
 def _aicluster_factory(base_factory, client_factory, region_factory, project_factory):
-    client = client_factory.create()
-    region = region_factory.create()
-    project = project_factory.create()
-
     class AIClusterFactory(base_factory):
-        cluster_id = factory_boy.Sequence(lambda n: get_timestamp_as_id() - n)
+        cluster_id = factory_boy.Sequence(lambda n: _BASE_ID - n)
         name = "test_cluster"
         status = AIClusterStatusEnum.ACTIVE
         interfaces = "[{}]"
-        creator_task_id = factory_boy.Sequence(lambda n: get_timestamp_as_id() - n)
-        task_id = factory_boy.Sequence(lambda n: get_timestamp_as_id() - n)
-        client_id = client.id
-        region_id = region.id
-        project_id = project.id
+        creator_task_id = factory_boy.Sequence(lambda n: _BASE_ID - n)
+        task_id = factory_boy.Sequence(lambda n: _BASE_ID - n)
+        client_id = factory_boy.LazyAttribute(lambda _: client_factory().id)
+        region_id = factory_boy.LazyAttribute(lambda _: region_factory().id)
+        project_id = factory_boy.LazyAttribute(lambda _: project_factory().id)
         image_id = "1"
         flavor_name = "1"
         vipu_version = "1.0"
@@ -219,10 +346,10 @@ def _aicluster_factory(base_factory, client_factory, region_factory, project_fac
         class Meta:
             model = AICluster
 
-    return AIClusterFactory
+    return _register_factory(AIClusterFactory)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def global_quota_factory(base_factory, client_factory):
     class GlobalQuotaFactory(base_factory):
         client_id = factory_boy.LazyAttribute(lambda _: client_factory().id)
@@ -234,6 +361,6 @@ def global_quota_factory(base_factory, client_factory):
         class Meta:
             model = GlobalQuotas
 
-    return GlobalQuotaFactory
+    return _register_factory(GlobalQuotaFactory)
 
 
@@ -1,3 +1,4 @@
+import functools
 from operator import itemgetter
 
 from django.urls import resolve
@@ -10,13 +11,39 @@ from rest_framework.schemas.openapi import AutoSchema
 from server.apps.common import mixins as common_mixins
 
 
+class _LazyQueryset:
+    """Class-level queryset that defers evaluation until first access.
+
+    Keeps DRF basename inference working (DefaultRouter asserts
+    ``viewset.queryset is not None``) without materializing a QuerySet at
+    class-construction time.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def __get__(self, instance, owner=None):
+        return self.model._default_manager.all()
+
+
 def dynamic_serializer(
     class_name, model, base_model=serializers.ModelSerializer, fields="__all__"
 ):
+    if isinstance(fields, list):
+        fields = tuple(fields)
+    return _dynamic_serializer(class_name, model, base_model, fields)
+
+
+# Memoized so repeated calls with the same arguments (e.g. viewsets built at
+# import time across test runs) reuse the generated classes instead of
+# constructing new ones.
+@functools.lru_cache(maxsize=None)
+def _dynamic_serializer(class_name, model, base_model, fields):
     cls_attrs = type("Meta", (object,), {"model": model, "fields": fields})
     return type(class_name, (base_model,), {"Meta": cls_attrs})
 
 
+@functools.lru_cache(maxsize=None)
 def dynamic_viewset(
     model,
     base_class_name=None,
@@ -36,11 +63,21 @@ def dynamic_viewset(
         serializer_class_name, model, base_model_serializer
     )
 
+    # Resolve the queryset lazily per request rather than materializing a
+    # QuerySet in the class body, which forces model resolution at class
+    # construction and pins the initial queryset across requests/tests.
+    def get_queryset(self):
+        return model._default_manager.all()
+
     return type(
         viewset_class_name,
         (
             common_mixins.ViewSetMixin,
             base_model_viewset,
         ),
-        {"queryset": model.objects.all(), "serializer_class": cls_serializer},
+        {
+            "queryset": _LazyQueryset(model),
+            "serializer_class": cls_serializer,
+            "get_queryset": get_queryset,
+        },
     )
@@ -4,7 +4,8 @@ import os
 
 from constance import config as cfg
 from django.db import transaction
-from django.db.models import Count, Sum
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import extend_schema
 from rest_framework import decorators
@@ -68,34 +69,32 @@ class CardViewSet(
 
     def get_queryset(self):
         if self.action == "stat":
-            return (
-                market_models.ViewCardStat.objects.filter(
-                    user=self.request.user,
-                )
-                .values(
-                    "id",
-                    "number",
-                    "currency_id",
-                    "user_id",
-                    "fio",
-                    "phone_number",
-                    "current_amount",
-                    "limit_amount",
-                    "limit_amount_contract",
-                    "limit_amount_24h",
-                    "limit_qty_24h",
-                    "current_qty_24h",
-                    "is_limit_amount_24h",
-                    "frozen_sum",
-                    "bank",
-                    "bank_id",
-                    "description",
-                    "is_published",
-                )
-                .annotate(
-                    order_count=Count("id"),
-                    day_sum=Sum("dst_amount"),
-                )
+            # order_count/day_sum come precomputed from the
+            # market_card_stat_mv materialized view (refreshed by the
+            # market app's beat task) instead of a per-request aggregate.
+            return market_models.ViewCardStatMV.objects.filter(
+                user=self.request.user,
+            ).values(
+                "id",
+                "number",
+                "currency_id",
+                "user_id",
+                "fio",
+                "phone_number",
+                "current_amount",
+                "limit_amount",
+                "limit_amount_contract",
+                "limit_amount_24h",
+                "limit_qty_24h",
+                "current_qty_24h",
+                "is_limit_amount_24h",
+                "frozen_sum",
+                "bank",
+                "bank_id",
+                "description",
+                "is_published",
+                "order_count",
+                "day_sum",
             )
 
         return market_models.Card.objects.filter(
@@ -117,24 +116,34 @@ class CardViewSet(
         detail=True,
     )
     def limits_reset(self, request, *args, **kwargs):
-        card = self.get_object()
+        updated = market_models.Card.objects.filter(
+            pk=kwargs["pk"], user=request.user
+        ).update(current_amount=0)
+        if not updated:
+            raise drf_exceptions.NotFound()
 
         market_models.CardCurrentLimit.objects.filter(
-            card=card, date=datetime.date.today()
+            card_id=kwargs["pk"], date=datetime.date.today()
         ).delete()
 
-        card.current_amount = 0
-
-        card.save(update_fields=["current_amount"])
-
         return response.Response(status=200)
 
     def destroy(self, request, *args, **kwargs):
-        card = self.get_object()
-        card.is_active = False
-        safe_delete_prefix = f"deleted_{card.id}_"
-        card.number = safe_delete_prefix + card.number
-        card.save(update_fields=["is_active", "number"])
+        # Single conditional UPDATE instead of get_object() + save(): the
+        # queryset filter replaces both the SELECT and the ownership check.
+        updated = market_models.Card.objects.filter(
+            pk=kwargs["pk"], user=request.user
+        ).update(
+            is_active=False,
+            number=Concat(
+                Value("deleted_"),
+                Cast("id", CharField()),
+                Value("_"),
+                "number",
+            ),
+        )
+        if not updated:
+            raise drf_exceptions.NotFound()
         return response.Response(status=204)
 
 
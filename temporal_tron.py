@@ -1,5 +1,9 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from decimal import Decimal
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
 from temporalio import activity
 from temporalio.exceptions import ApplicationError
@@ -8,17 +12,20 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy import (
     Column,
+    Index,
     Integer,
     String,
     Numeric,
     Boolean,
     desc,
     select,
+    text,
     update,
     ForeignKey,
 )
 
 import aiohttp
+import orjson
 from aiolimiter import AsyncLimiter
 from settings import (
     DATABASE_URL,
@@ -29,13 +36,57 @@ from settings import (
 )
 
 # Database setup
+# echo formats and logs every emitted statement — a per-query CPU tax even
+# without a handler installed — so keep it off unless explicitly requested.
 engine = create_async_engine(
-    DATABASE_URL, echo=True, pool_size=20, max_overflow=0
+    DATABASE_URL,
+    echo=bool(os.getenv("SQL_ECHO")),
+    pool_size=20,
+    max_overflow=0,
+    insertmanyvalues_page_size=1000,
 )
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Session shared along an async call chain: helpers invoked under an open
+# _with_session reuse the caller's AsyncSession instead of constructing a
+# fresh one per step.
+_current_session: ContextVar[Optional[AsyncSession]] = ContextVar(
+    "_current_session", default=None
+)
+
+
+@asynccontextmanager
+async def _with_session():
+    session = _current_session.get()
+    if session is not None:
+        yield session
+        return
+    async with async_session() as session:
+        token = _current_session.set(session)
+        try:
+            yield session
+        finally:
+            _current_session.reset(token)
+
+
+@asynccontextmanager
+async def _begin(session: AsyncSession):
+    """Enter a transaction on ``session``, nesting if one is already open.
+
+    A session reused from _with_session may arrive mid-transaction, where a
+    plain session.begin() would raise InvalidRequestError; inner scopes get
+    a SAVEPOINT instead.
+    """
+    if session.in_transaction():
+        async with session.begin_nested():
+            yield
+    else:
+        async with session.begin():
+            yield
+
+
 Base = declarative_base()
 
 
@@ -46,9 +97,16 @@ class InnerAddress(Base):
     is_external = Column(Boolean, default=False, nullable=False)
     address = Column(String(255), unique=True, nullable=False)
     amount = Column(Integer, default=0, index=True, nullable=False)
+    usdt_balance = Column(Numeric(20, 6), default=0, nullable=False)
     is_aml_ban = Column(Boolean, default=False, nullable=False)
     is_locked = Column(Boolean, default=False, nullable=False)
 
+    # Serves the unlocked-addresses-by-balance scan in
+    # select_addresses_for_withdrawal (ORDER BY usdt_balance DESC LIMIT n).
+    __table_args__ = (
+        Index("ix_addr_unlocked_balance", "is_locked", text("usdt_balance DESC")),
+    )
+
 
 class User(Base):
     __tablename__ = "pks_user_user"
@@ -68,30 +126,72 @@ class UserWallet(Base):
 tron_api_limiter = AsyncLimiter(100, 1)
 db_limiter = AsyncLimiter(1000, 1)
 
+# Shared HTTP session, created lazily on first use. Pooling keeps Tron API
+# connections alive instead of paying a TCP+TLS handshake per call.
+_http_session: Optional[aiohttp.ClientSession] = None
+_http_session_lock = asyncio.Lock()
+
+
+async def _get_http_session() -> aiohttp.ClientSession:
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        async with _http_session_lock:
+            if _http_session is None or _http_session.closed:
+                _http_session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=100, ttl_dns_cache=300, keepalive_timeout=60
+                    )
+                )
+    return _http_session
+
+
+async def close_http_session() -> None:
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
 
 async def get_tron_balance(address: str) -> Tuple[Decimal, Decimal]:
     async with tron_api_limiter:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"{TRON_API_URL}/v1/accounts/{address}"
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    trx_balance = Decimal(data.get("balance", 0)) / Decimal(
-                        1_000_000
-                    )
-                    usdt_balance = Decimal(0)
-                    for token in data.get("trc20", []):
-                        if token[USDT_CONTRACT_ADDRESS]:
-                            usdt_balance = Decimal(
-                                token[USDT_CONTRACT_ADDRESS]
-                            ) / Decimal(1_000_000)
-                            break
-                    return trx_balance, usdt_balance
-                else:
-                    raise ValueError(
-                        f"Failed to get balance for address {address}"
-                    )
+        session = await _get_http_session()
+        async with session.get(
+            f"{TRON_API_URL}/v1/accounts/{address}"
+        ) as response:
+            if response.status == 200:
+                data = orjson.loads(await response.read())
+                # Balances arrive as ints scaled by 10**6; keep them as
+                # ints on the parse path and only convert to Decimal at
+                # the return boundary.
+                raw_trx = int(data.get("balance", 0))
+                raw_usdt = 0
+                for token in data.get("trc20", []):
+                    value = token.get(USDT_CONTRACT_ADDRESS)
+                    if value is not None:
+                        raw_usdt = int(value)
+                        break
+                return (
+                    Decimal(raw_trx) / 1_000_000,
+                    Decimal(raw_usdt) / 1_000_000,
+                )
+            else:
+                raise ValueError(
+                    f"Failed to get balance for address {address}"
+                )
+
+
+async def get_tron_balances(
+    addresses: List[str],
+) -> List[Tuple[Decimal, Decimal]]:
+    """Fetch balances for many addresses concurrently.
+
+    Awaiting get_tron_balance per address serializes the calls behind the
+    event loop; gathering them lets tron_api_limiter, not the await chain,
+    gate throughput.
+    """
+    return await asyncio.gather(
+        *(get_tron_balance(address) for address in addresses)
+    )
 
 
 async def send_tron_transaction(
@@ -101,63 +201,70 @@ async def send_tron_transaction(
     token_address: str = None,
 ) -> bool:
     async with tron_api_limiter:
-        async with aiohttp.ClientSession() as session:
-            if token_address:
-                endpoint = f"{TRON_API_URL}/wallet/triggersmartcontract"
-                data = {
-                    "owner_address": from_address,
-                    "contract_address": token_address,
-                    "function_selector": "transfer(address,uint256)",
-                    "parameter": f"{to_address},{int(amount * Decimal(1_000_000))}",
-                    "fee_limit": FEE_LIMIT,
-                }
-            else:
-                endpoint = f"{TRON_API_URL}/wallet/createtransaction"
-                data = {
-                    "to_address": to_address,
-                    "owner_address": from_address,
-                    "amount": int(amount * Decimal(1_000_000)),
-                }
+        session = await _get_http_session()
+        if token_address:
+            endpoint = f"{TRON_API_URL}/wallet/triggersmartcontract"
+            data = {
+                "owner_address": from_address,
+                "contract_address": token_address,
+                "function_selector": "transfer(address,uint256)",
+                "parameter": f"{to_address},{int(amount * Decimal(1_000_000))}",
+                "fee_limit": FEE_LIMIT,
+            }
+        else:
+            endpoint = f"{TRON_API_URL}/wallet/createtransaction"
+            data = {
+                "to_address": to_address,
+                "owner_address": from_address,
+                "amount": int(amount * Decimal(1_000_000)),
+            }
 
-            async with session.post(endpoint, json=data) as response:
-                return response.status == 200
+        async with session.post(
+            endpoint,
+            data=orjson.dumps(data),
+            headers={"Content-Type": "application/json"},
+        ) as response:
+            return response.status == 200
 
 
 @activity.defn
 async def check_user_balance_and_withdraw(params: dict) -> bool:
     async with db_limiter:
-        async with async_session() as session:
-            async with session.begin():
-                user_wallet = await session.execute(
-                    select(UserWallet)
-                    .where(UserWallet.user_id == params["user_id"])
-                    .with_for_update()
+        async with _with_session() as session:
+            async with _begin(session):
+                # Atomic conditional UPDATE: the balance check and debit
+                # happen in one statement, so no SELECT ... FOR UPDATE or
+                # second UPDATE at commit is needed.
+                result = await session.execute(
+                    update(UserWallet)
+                    .where(
+                        UserWallet.user_id == params["user_id"],
+                        UserWallet.usdt_balance >= params["amount"],
+                    )
+                    .values(
+                        usdt_balance=UserWallet.usdt_balance
+                        - params["amount"]
+                    )
+                    .returning(UserWallet.id)
                 )
-                user_wallet = user_wallet.scalar_one_or_none()
 
-                if (
-                    not user_wallet
-                    or user_wallet.usdt_balance < params["amount"]
-                ):
+                if result.first() is None:
                     raise ValueError(
                         f"Insufficient balance for user {params['user_id']}"
                     )
 
-                user_wallet.usdt_balance -= params["amount"]
-                await session.commit()
-
     return True
 
 
 @activity.defn
 async def rollback_user_balance(params: Dict) -> bool:
     async with db_limiter:
-        async with async_session() as session:
-            async with session.begin():
+        async with _with_session() as session:
+            async with _begin(session):
                 user_wallet = await session.execute(
                     select(UserWallet)
                     .where(UserWallet.user_id == params["user_id"])
-                    .with_for_update()
+                    .with_for_update(of=UserWallet)
                 )
                 user_wallet = user_wallet.scalar_one_or_none()
 
@@ -167,64 +274,75 @@ async def rollback_user_balance(params: Dict) -> bool:
                     )
 
                 user_wallet.usdt_balance += params["amount"]
-                await session.commit()
 
     return True
 
+# Upper bound on addresses fetched per withdrawal; keeps the locking SELECT
+# to a single round-trip while covering any realistic contribution count.
+ADDRESS_SELECTION_CAP = 64
+
+
 @activity.defn
 async def select_addresses_for_withdrawal(
     params: Dict,
 ) -> Tuple[str, List[Dict]]:
     async with db_limiter:
-        async with async_session() as session:
-            selected = []
-            remaining = params["target_amount"]
-            consolidation_address = None
-
-            while remaining > 0:
-                async with session.begin():
-                    query = (
-                        select(InnerAddress)
-                        .where(
-                            InnerAddress.usdt_balance > 0,
-                            InnerAddress.is_locked == False,
-                        )
-                        .order_by(desc(InnerAddress.usdt_balance))
-                        .with_for_update(skip_locked=True)
-                        .limit(1)
+        async with _with_session() as session:
+            async with _begin(session):
+                query = (
+                    select(InnerAddress)
+                    .where(
+                        InnerAddress.usdt_balance > 0,
+                        InnerAddress.is_locked == False,
                     )
-                    result = await session.execute(query)
-                    address = result.scalar_one_or_none()
+                    .order_by(desc(InnerAddress.usdt_balance))
+                    .with_for_update(skip_locked=True)
+                    .limit(ADDRESS_SELECTION_CAP)
+                )
+                result = await session.execute(query)
+                addresses = result.scalars().all()
 
-                    if not address:
-                        break
+                selected = []
+                locked_ids = []
+                remaining = params["target_amount"]
+                consolidation_address = None
 
-                    if not consolidation_address:
+                for address in addresses:
+                    if consolidation_address is None:
                         consolidation_address = address.address
-                    elif address.address != consolidation_address:
-                        if address.usdt_balance <= remaining:
-                            selected.append(
-                                {
-                                    "address": address.address,
-                                    "amount": address.usdt_balance,
-                                }
-                            )
-                            remaining -= address.usdt_balance
-                        else:
-                            selected.append(
-                                {
-                                    "address": address.address,
-                                    "amount": remaining,
-                                }
-                            )
-                            remaining = 0
+                        locked_ids.append(address.id)
+                        continue
+
+                    if address.usdt_balance <= remaining:
+                        selected.append(
+                            {
+                                "address": address.address,
+                                "amount": address.usdt_balance,
+                            }
+                        )
+                        remaining -= address.usdt_balance
+                    else:
+                        selected.append(
+                            {
+                                "address": address.address,
+                                "amount": remaining,
+                            }
+                        )
+                        remaining = 0
+                    locked_ids.append(address.id)
 
-                    address.is_locked = True
-                    await session.commit()
+                    if remaining <= 0:
+                        break
 
-            if remaining > 0:
-                raise ValueError(
-                    f"Insufficient USDT funds across addresses. Short by {remaining}"
+                if remaining > 0:
+                    raise ValueError(
+                        f"Insufficient USDT funds across addresses. Short by {remaining}"
+                    )
+
+                await session.execute(
+                    update(InnerAddress)
+                    .where(InnerAddress.id.in_(locked_ids))
+                    .values(is_locked=True)
                 )
 
             return consolidation_address, selected
@@ -249,8 +367,8 @@ async def withdraw_usdt_to_external(params: Dict) -> bool:
 
         if success:
             async with db_limiter:
-                async with async_session() as session:
-                    async with session.begin():
+                async with _with_session() as session:
+                    async with _begin(session):
                         query = (
                             update(InnerAddress)
                             .where(
@@ -262,7 +380,6 @@ async def withdraw_usdt_to_external(params: Dict) -> bool:
                             )
                         )
                         await session.execute(query)
-                    await session.commit()
 
             return True
         else:
@@ -273,18 +390,25 @@ async def withdraw_usdt_to_external(params: Dict) -> bool:
         )
 
 
+# Keep IN-lists bounded so a huge address batch does not balloon statement
+# parse time or per-statement memory on the Postgres side.
+UNLOCK_CHUNK_SIZE = 1000
+
+
 @activity.defn
 async def unlock_addresses(params: Dict) -> None:
+    addresses = params["addresses"]
     async with db_limiter:
-        async with async_session() as session:
-            async with session.begin():
-                query = (
-                    update(InnerAddress)
-                    .where(InnerAddress.address.in_(params["addresses"]))
-                    .values(is_locked=False)
-                )
-                await session.execute(query)
-            await session.commit()
+        async with _with_session() as session:
+            async with _begin(session):
+                for start in range(0, len(addresses), UNLOCK_CHUNK_SIZE):
+                    chunk = addresses[start : start + UNLOCK_CHUNK_SIZE]
+                    query = (
+                        update(InnerAddress)
+                        .where(InnerAddress.address.in_(chunk))
+                        .values(is_locked=False)
+                    )
+                    await session.execute(query)
 
 
 
@@ -296,6 +420,7 @@ from utils import setup_temporal_client
 from crypto_withdrawal_workflow import (
     CryptoWithdrawalWorkflow,
     check_user_balance_and_withdraw,
+    close_http_session,
     rollback_user_balance,
     check_and_replenish_gas,
     select_addresses_for_withdrawal,
@@ -324,7 +449,10 @@ async def run_worker():
         ]
     )
 
-    await worker.run()
+    try:
+        await worker.run()
+    finally:
+        await close_http_session()
 
 if __name__ == "__main__":
     asyncio.run(run_worker())
\ No newline at end of file